@@ -0,0 +1,129 @@
+""" Пакетное вычисление сохраненных пресетов без открытия окна
+
+Примеры:
+    python batch.py                          # все пресеты, JSON в stdout
+    python batch.py 1 5 7 --format csv       # выбранные пресеты, CSV
+    python batch.py --workers 4 -o out.json  # пул процессов, запись в файл
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+import dearpygui.dearpygui as dpg
+
+from database import get_db
+from library.node_editor import NodeEditor, NodeFreezer
+from ui import ResultNode
+
+
+# NodeEditor процесса, переиспользуется между пресетами
+_editor: Optional[NodeEditor] = None
+
+
+def _init_worker(read_only_cache: bool = False) -> None:
+    """
+    Контекст dearpygui без viewport: элементы создаются, но не отрисовываются.
+    Процессы пула только читают кэш результатов, чтобы не конкурировать за запись в main.db
+    """
+    global _editor
+    dpg.create_context()
+    _editor = NodeEditor()
+    get_db().result_cache_read_only = read_only_cache
+
+
+def run_preset(rowid: int) -> dict[str, Any]:
+    """ Загрузить пресет, вычислить все ResultNode и замерить время """
+
+    started = time.perf_counter()
+    # Имя читается отдельно от состояния, чтобы строку с ошибкой декодирования можно было опознать
+    name = None
+    try:
+        name = get_db().select_node_editor_state_name(rowid)
+        row = get_db().select_node_editor_state(rowid)
+        if row is None:
+            raise LookupError("preset not found")
+        NodeFreezer.restore_editor_state(_editor, row["state"])
+    except Exception as e:
+        # Ошибка одного пресета не должна прерывать весь пакет
+        error = str(e) if isinstance(e, LookupError) else repr(e)
+        return {
+            "rowid": rowid,
+            "name": name,
+            "error": error,
+            "load_seconds": time.perf_counter() - started,
+            "eval_seconds": 0.0,
+            "results": []
+        }
+    loaded = time.perf_counter()
+
+    results = []
+    result_nodes = [n for n in _editor.nodes if isinstance(n, ResultNode)]
+    for idx, node in enumerate(result_nodes):
+        try:
+            results.append({"idx": idx, "label": node.label, "value": node.evaluate(), "error": None})
+        except Exception as e:
+            results.append({"idx": idx, "label": node.label, "value": None, "error": repr(e)})
+    finished = time.perf_counter()
+
+    return {
+        "rowid": rowid,
+        "name": name,
+        "error": None,
+        "load_seconds": loaded - started,
+        "eval_seconds": finished - loaded,
+        "results": results
+    }
+
+
+def write_json(reports: list[dict], file) -> None:
+    json.dump(reports, file, indent=2, default=str)
+    file.write("\n")
+
+
+def write_csv(reports: list[dict], file) -> None:
+    fieldnames = ["rowid", "name", "idx", "label", "value", "error", "load_seconds", "eval_seconds"]
+    writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    for report in reports:
+        if not report["results"]:
+            writer.writerow(report)
+        for result in report["results"]:
+            writer.writerow({**report, **result, "error": result["error"] or report["error"]})
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(description="Вычисление сохраненных пресетов из main.db")
+    parser.add_argument("rowids", nargs="*", type=int, help="rowid пресетов (по умолчанию все)")
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("-o", "--output", help="файл результата (по умолчанию stdout)")
+    parser.add_argument("--workers", type=int, default=1, help="количество процессов")
+    args = parser.parse_args(argv)
+
+    rowids = args.rowids or [row["rowid"] for row in get_db().select_node_editor_states_info()]
+
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(True,)) as pool:
+            reports = list(pool.map(run_preset, rowids, chunksize=max(1, len(rowids) // (args.workers * 4))))
+    else:
+        _init_worker()
+        reports = [run_preset(rowid) for rowid in rowids]
+        dpg.destroy_context()
+
+    write = write_json if args.format == "json" else write_csv
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as file:
+            write(reports, file)
+    else:
+        write(reports, sys.stdout)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
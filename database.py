@@ -1,10 +1,20 @@
+from __future__ import annotations
+
 import sqlite3
+import time
+from contextlib import contextmanager
+from functools import cache
+from typing import Any, Iterator, Optional, TYPE_CHECKING
 
 import jsonpickle
+from loguru import logger
 from pathlib import Path
 
 from library.sqlite import SQLite
 
+if TYPE_CHECKING:
+    from library.node_editor import NodeFreezer
+
 
 def setup_custom_types() -> type:
     """ Пользовательские типы данных для сохранения в БД """
@@ -23,12 +33,22 @@ def setup_custom_types() -> type:
     return NodeFreezer.EditorState
 
 
-NodeEditorState = setup_custom_types()
+class Database(SQLite):
 
+    # Максимальное количество записей в кэше результатов
+    result_cache_size: int = 10000
 
-class Database(SQLite):
+    # Не записывать новые результаты в кэш (параллельные процессы batch.py)
+    result_cache_read_only: bool = False
+
+    # Вытеснение из кэша выполняется после такого количества вставок, а не после каждой
+    result_cache_evict_every: int = 100
+
+    _result_cache_conn: Optional[sqlite3.Connection] = None  # Соединение открытого сеанса кэша
+    _result_cache_hits: Optional[list[str]] = None  # Ключи, у которых нужно обновить accessed
+    _result_cache_inserts: int = 0  # Вставок с последнего вытеснения
 
-    def insert_node_editor_state(self, name: str, state: NodeEditorState) -> int:
+    def insert_node_editor_state(self, name: str, state: NodeFreezer.EditorState) -> int:
         """ Добавить запись в таблицу node_editor_state """
 
         with self.connection() as conn:
@@ -39,7 +59,10 @@ class Database(SQLite):
 
             stmt = "SELECT last_insert_rowid() AS rowid"
             cur = conn.execute(stmt)
-            return cur.fetchone()["rowid"]
+            rowid = cur.fetchone()["rowid"]
+
+            self._index_node_editor_state(conn, rowid, state)
+            return rowid
 
     def select_node_editor_states_info(self) -> list[dict]:
         """ Получить инфу о сохраненных состояниях node_editor_state """
@@ -57,12 +80,210 @@ class Database(SQLite):
             cur = conn.execute(stmt, (rowid,))
             return cur.fetchone()
 
+    def select_node_editor_state_name(self, rowid: int) -> Optional[str]:
+        """ Получить имя записи node_editor_state, не декодируя состояние """
+
+        with self.connection() as conn:
+            stmt = "SELECT name FROM node_editor_state WHERE rowid = ?"
+            row = conn.execute(stmt, (rowid,)).fetchone()
+            return row["name"] if row is not None else None
+
     def delete_node_editor_state(self, rowid: int):
         """ Удалить одну запись из node_editor_state """
 
         with self.connection() as conn:
             stmt = "DELETE FROM node_editor_state WHERE rowid = ?"
             conn.execute(stmt, (rowid,))
+            self._unindex_node_editor_state(conn, rowid)
+
+    def search_node_editor_states(self,
+                                  node_type: Optional[str] = None,  # Тип узла, который должен быть в пресете
+                                  params: Optional[dict[str, Any]] = None,  # Параметры этого же узла
+                                  min_nodes: Optional[int] = None,
+                                  max_nodes: Optional[int] = None
+                                  ) -> list[dict]:
+        """ Найти пресеты по структуре, не загружая сами состояния """
+
+        # Пресеты, которые не удалось проиндексировать, хранят статистику с node_count NULL
+        conditions = ["s.node_count IS NOT NULL"]
+        values = []
+
+        if node_type is not None or params:
+            node_conditions = ["n.preset_rowid = s.preset_rowid"]
+            if node_type is not None:
+                node_conditions.append("n.node_type = ?")
+                values.append(node_type)
+            for key, value in (params or {}).items():
+                node_conditions.append(
+                    "EXISTS (SELECT 1 FROM preset_param p WHERE p.preset_rowid = n.preset_rowid"
+                    " AND p.node_idx = n.node_idx AND p.key = ? AND p.value = ?)"
+                )
+                values.extend([key, str(value)])
+            conditions.append(f"EXISTS (SELECT 1 FROM preset_node n WHERE {' AND '.join(node_conditions)})")
+
+        if min_nodes is not None:
+            conditions.append("s.node_count >= ?")
+            values.append(min_nodes)
+
+        if max_nodes is not None:
+            conditions.append("s.node_count <= ?")
+            values.append(max_nodes)
+
+        stmt = """
+        SELECT e.rowid, e.name, s.node_count, s.link_count
+        FROM preset_stats s JOIN node_editor_state e ON e.rowid = s.preset_rowid
+        """
+        stmt += " WHERE " + " AND ".join(conditions)
+
+        with self.connection() as conn:
+            cur = conn.execute(stmt, values)
+            return cur.fetchall()
+
+    def reindex_node_editor_states(self, only_missing: bool = True) -> None:
+        """ Заполнить поисковый индекс для пресетов, сохраненных до его появления """
+
+        with self.connection() as conn:
+
+            stmt = "SELECT rowid FROM node_editor_state"
+            if only_missing:
+                stmt += " WHERE rowid NOT IN (SELECT preset_rowid FROM preset_stats)"
+            rowids = [row["rowid"] for row in conn.execute(stmt)]
+
+            for rowid in rowids:
+                stmt = "SELECT state FROM node_editor_state WHERE rowid = ?"
+                self._unindex_node_editor_state(conn, rowid)
+                try:
+                    state = conn.execute(stmt, (rowid,)).fetchone()["state"]
+                    self._index_node_editor_state(conn, rowid, state)
+                except Exception:
+                    # Поврежденный пресет не индексируется и не мешает открыть БД.
+                    # Статистика с node_count NULL отмечает его, чтобы не декодировать при каждом запуске
+                    logger.exception(f"preset {rowid} cannot be indexed")
+                    self._unindex_node_editor_state(conn, rowid)
+                    stmt = "INSERT INTO preset_stats(preset_rowid, node_count, link_count) VALUES (?, NULL, NULL)"
+                    conn.execute(stmt, (rowid,))
+
+    @staticmethod
+    def _index_node_editor_state(conn: sqlite3.Connection, rowid: int, state: NodeFreezer.EditorState) -> None:
+        """ Записать типы узлов, значения параметров и статистику пресета в таблицы индекса """
+
+        node_rows = []
+        param_rows = []
+        link_count = 0
+
+        for node_idx, node_state in enumerate(state.nodes):
+            node_rows.append((rowid, node_idx, type(node_state.obj).__name__))
+            for key, value in node_state.params_dict.items():
+                param_rows.append((rowid, node_idx, key, str(value)))
+            link_count += len(list(node_state.obj.input_links))
+
+        stmt = "INSERT INTO preset_node(preset_rowid, node_idx, node_type) VALUES (?, ?, ?)"
+        conn.executemany(stmt, node_rows)
+
+        stmt = "INSERT INTO preset_param(preset_rowid, node_idx, key, value) VALUES (?, ?, ?, ?)"
+        conn.executemany(stmt, param_rows)
+
+        stmt = "INSERT INTO preset_stats(preset_rowid, node_count, link_count) VALUES (?, ?, ?)"
+        conn.execute(stmt, (rowid, len(node_rows), link_count))
+
+    @staticmethod
+    def _unindex_node_editor_state(conn: sqlite3.Connection, rowid: int) -> None:
+        for table in ("preset_node", "preset_param", "preset_stats"):
+            conn.execute(f"DELETE FROM {table} WHERE preset_rowid = ?", (rowid,))
+
+    @contextmanager
+    def result_cache_session(self) -> Iterator[None]:
+        """
+        Все обращения к кэшу результатов внутри блока идут через одно соединение и одну транзакцию.
+        Вложенные блоки используют соединение внешнего
+        """
+
+        if self._result_cache_conn is not None:
+            yield
+            return
+
+        with self.connection() as conn:
+            self._result_cache_conn = conn
+            self._result_cache_hits = []
+            try:
+                yield
+            finally:
+                # Результаты, вычисленные до ошибки, тоже сохраняются
+                if self._result_cache_hits and not self.result_cache_read_only:
+                    stmt = "UPDATE result_cache SET accessed = ? WHERE key = ?"
+                    accessed = time.time()
+                    conn.executemany(stmt, [(accessed, key) for key in self._result_cache_hits])
+                conn.commit()
+                self._result_cache_conn = None
+                self._result_cache_hits = None
+
+    def select_result_cache(self, key: str) -> Optional[dict]:
+        """ Получить результат вычисления из кэша по хэшу подграфа """
+
+        with self.result_cache_session():
+            stmt = "SELECT value FROM result_cache WHERE key = ?"
+            cur = self._result_cache_conn.execute(stmt, (key,))
+            row = cur.fetchone()
+            if row is not None:
+                self._result_cache_hits.append(key)
+            return row
+
+    def insert_result_cache(self, key: str, value: Any, node_types: list[str]) -> None:
+        """ Сохранить результат вычисления в кэш, периодически вытесняя давно не используемые записи """
+
+        if self.result_cache_read_only:
+            return
+
+        with self.result_cache_session():
+            conn = self._result_cache_conn
+
+            stmt = """
+            INSERT OR REPLACE INTO result_cache(key, value, node_types, accessed)
+            VALUES (?, ?, ?, ?)
+            """
+            # value сохраняется как BLOB, чтобы SQLite не приводил 6.0 к 6 из-за NUMERIC affinity
+            # node_types хранятся через пробел с обрамляющими пробелами для поиска через LIKE
+            value = jsonpickle.encode(value).encode()
+            values = (key, value, f" {' '.join(node_types)} ", time.time())
+            conn.execute(stmt, values)
+
+            self._result_cache_inserts += 1
+            if self._result_cache_inserts < self.result_cache_evict_every:
+                return
+            self._result_cache_inserts = 0
+
+            # Вытесняются по количеству записей: одинаковые accessed (один сеанс, грубые часы)
+            # упорядочиваются по rowid, поэтому размер кэша ограничен и при совпадении времени
+            stmt = """
+            DELETE FROM result_cache WHERE key IN (
+                SELECT key FROM result_cache ORDER BY accessed DESC, rowid DESC LIMIT -1 OFFSET ?
+            )
+            """
+            conn.execute(stmt, (self.result_cache_size,))
+
+    def sync_node_type_versions(self, versions: dict[str, int]) -> None:
+        """ Сбросить кэш результатов для типов узлов, у которых изменилась версия """
+
+        with self.connection() as conn:
+
+            stmt = "SELECT node_type, version FROM node_type_version"
+            saved = {row["node_type"]: row["version"] for row in conn.execute(stmt)}
+
+            for node_type, version in versions.items():
+                if saved.get(node_type) == version:
+                    continue
+
+                stmt = "DELETE FROM result_cache WHERE node_types LIKE ?"
+                conn.execute(stmt, (f"% {node_type} %",))
+
+                stmt = "INSERT OR REPLACE INTO node_type_version(node_type, version) VALUES (?, ?)"
+                conn.execute(stmt, (node_type, version))
+
+    def clear_result_cache(self) -> None:
+        """ Очистить кэш результатов """
+
+        with self.connection() as conn:
+            conn.execute("DELETE FROM result_cache")
 
 
 # запрос для инициализации таблиц БД
@@ -70,10 +291,47 @@ INIT_STMT = """
 CREATE TABLE IF NOT EXISTS node_editor_state (
     name TEXT,
     state PYOBJECT
-)
+);
+CREATE TABLE IF NOT EXISTS result_cache (
+    key TEXT PRIMARY KEY,
+    value PYOBJECT,
+    node_types TEXT,
+    accessed REAL
+);
+CREATE INDEX IF NOT EXISTS result_cache_accessed ON result_cache(accessed);
+CREATE TABLE IF NOT EXISTS node_type_version (
+    node_type TEXT PRIMARY KEY,
+    version INTEGER
+);
+CREATE TABLE IF NOT EXISTS preset_node (
+    preset_rowid INTEGER,
+    node_idx INTEGER,
+    node_type TEXT
+);
+CREATE INDEX IF NOT EXISTS preset_node_type ON preset_node(node_type, preset_rowid);
+CREATE TABLE IF NOT EXISTS preset_param (
+    preset_rowid INTEGER,
+    node_idx INTEGER,
+    key TEXT,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS preset_param_key_value ON preset_param(key, value, preset_rowid, node_idx);
+CREATE TABLE IF NOT EXISTS preset_stats (
+    preset_rowid INTEGER PRIMARY KEY,
+    node_count INTEGER,
+    link_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS preset_stats_node_count ON preset_stats(node_count)
 """
 
-db = Database(
-    filepath=Path("main.db"),
-    init_stmt=INIT_STMT
-)
+
+@cache
+def get_db() -> Database:
+    """ БД приложения. Адаптеры типов и файл БД инициализируются при первом обращении """
+    setup_custom_types()
+    db = Database(
+        filepath=Path("main.db"),
+        init_stmt=INIT_STMT
+    )
+    db.reindex_node_editor_states()
+    return db
@@ -0,0 +1,27 @@
+import gc
+
+import dearpygui.dearpygui as dpg
+
+from library.node_editor import Node
+
+
+def get_resource_counts(collect: bool = False) -> dict[str, int]:
+    """
+    Количество живых ресурсов: узлов, связей, элементов dearpygui и тем.
+    Если collect=True, перед подсчетом запускается сборщик мусора,
+    тогда в nodes остаются только узлы, на которые есть ссылки
+    """
+
+    if collect:
+        gc.collect()
+
+    nodes = list(Node.instances)
+    items = dpg.get_all_items()
+    item_types = [dpg.get_item_info(item)["type"] for item in items]
+
+    return {
+        "nodes": len(nodes),
+        "links": sum(len(list(n.input_links)) for n in nodes),
+        "dpg_items": len(items),
+        "themes": item_types.count("mvAppItemType::mvTheme")
+    }
@@ -0,0 +1,118 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+import dearpygui.dearpygui as dpg
+from loguru import logger
+
+from library.node_editor import Node, NodeEditor
+
+
+# Поток для чтения и декодирования фрагментов, чтобы не блокировать отрисовку
+_executor = ThreadPoolExecutor(max_workers=1)
+
+# Загрузчики, которые еще добавляют узлы. dearpygui хранит один callback на номер кадра,
+# поэтому все загрузчики обслуживаются общим callback'ом _on_frame
+_active: list["FragmentLoader"] = []
+
+
+def _schedule() -> None:
+    dpg.set_frame_callback(dpg.get_frame_count() + 1, _on_frame)
+
+
+def _on_frame() -> None:
+    """ Выполнить по шагу каждого активного загрузчика и запланировать следующий кадр """
+    for loader in list(_active):
+        if not loader._step():
+            _active.remove(loader)
+    if _active:
+        _schedule()
+
+
+class FragmentLoader:
+    """
+    Покадровое добавление фрагмента в NodeEditor.
+    Фрагмент получается функцией load в отдельном потоке, затем узлы и связи
+    добавляются порциями в общем frame callback'е, не дольше frame_budget за кадр
+    """
+
+    def __init__(self,
+                 editor: NodeEditor,
+                 load: Callable[[], NodeEditor.Fragment],  # Вызывается в отдельном потоке
+                 offset: tuple[int, int] = (0, 0),  # Сдвиг узлов относительно позиций во фрагменте
+                 frame_budget: float = 0.008,  # Секунд на добавление узлов за один кадр
+                 on_progress: Optional[Callable[[float], None]] = None,
+                 on_finish: Optional[Callable[[bool], None]] = None  # True, если загрузка завершена полностью
+                 ) -> None:
+
+        self._editor = editor
+        self._load = load
+        self._offset = offset
+        self._frame_budget = frame_budget
+        self._on_progress = on_progress
+        self._on_finish = on_finish
+
+        self._future: Optional[Future] = None
+        self._steps: Optional[Iterator[list[Node]]] = None
+        self._nodes: list[Node] = []
+        self._done_steps = 0
+        self._total_steps = 0
+        self._cancelled = False
+        self._finished = False
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def start(self) -> None:
+        self._future = _executor.submit(self._load)
+        _active.append(self)
+        if len(_active) == 1:
+            _schedule()
+
+    def cancel(self) -> None:
+        """ Остановить загрузку и удалить уже добавленные узлы """
+        self._cancelled = True
+
+    def _step(self) -> bool:
+        """ Шаг загрузки в текущем кадре. False, если загрузка закончена """
+
+        if self._cancelled:
+            live = set(self._editor.nodes)
+            nodes = [n for n in self._nodes if n in live]
+            self._editor.emit("delete", [], nodes)
+            self._editor.delete_nodes(nodes)
+            self._finish(False)
+            return False
+
+        try:
+            if self._steps is None:
+                if not self._future.done():
+                    return True
+                fragment = self._future.result()
+                # Шаги iter_add_fragment: узлы, связи и финальный сброс кэшей
+                self._total_steps = len(fragment.nodes) + len(fragment.links) + 1
+                self._steps = self._editor.iter_add_fragment(fragment, self._offset)
+
+            started = time.perf_counter()
+            while time.perf_counter() - started < self._frame_budget:
+                self._nodes = next(self._steps)
+                self._done_steps += 1
+
+        except StopIteration:
+            self._finish(True)
+            return False
+
+        except Exception:
+            logger.exception("fragment loading failed")
+            self._finish(False)
+            return False
+
+        if self._on_progress is not None:
+            self._on_progress(self._done_steps / self._total_steps)
+        return True
+
+    def _finish(self, completed: bool) -> None:
+        self._finished = True
+        if self._on_finish is not None:
+            self._on_finish(completed)
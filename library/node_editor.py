@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+import hashlib
+import weakref
 from dataclasses import dataclass
-from typing import Any, Iterator, Optional
+from typing import Any, Callable, Iterator, Optional
 
 import dearpygui.dearpygui as dpg
+from loguru import logger
 
 from library.value_editor import ValueEditor
 
 
 class Node:
 
+    # Версия реализации узла. Увеличивать при изменении логики вычисления,
+    # чтобы устаревшие результаты в кэше не использовались
+    version: int = 1
+
+    # Все созданные и еще не собранные сборщиком мусора узлы (для диагностики утечек)
+    instances: weakref.WeakSet[Node] = weakref.WeakSet()
+
     @dataclass
     class Input:
         node: Node
@@ -45,6 +55,10 @@ class Node:
         self._links: list[Node.Link] = []
         self._params: list[Node.Param] = []
         self._widgets: list[int] = []
+        self._subgraph_hash: Optional[str] = None
+        self._params_dict: Optional[dict[str, Any]] = None
+        self._theme: Optional[int] = None
+        self._theme_color: Optional[int] = None
 
         with dpg.stage() as self._stage:
 
@@ -62,6 +76,9 @@ class Node:
                     attr = dpg.add_node_attribute(attribute_type=dpg.mvNode_Attr_Output)
                     self._outputs.append(Node.Output(node=self, tag=attr))
 
+        # После создания self._tag, т.к. __hash__ узла возвращает tag
+        Node.instances.add(self)
+
     def __hash__(self) -> int:
         return self._tag
 
@@ -69,6 +86,10 @@ class Node:
     def tag(self) -> int:
         return self._tag
 
+    @property
+    def label(self) -> str:
+        return self._label
+
     @property
     def inputs(self) -> Iterator[Node.Input]:
         for i in self._inputs:
@@ -130,7 +151,30 @@ class Node:
 
     @property
     def params_dict(self) -> dict[str, Any]:
-        return {p.key: p.value for p in self.params}
+        # Словарь кэшируется до следующего изменения параметров, его нельзя изменять на месте
+        if self._params_dict is None:
+            self._params_dict = {p.key: p.value for p in self.params}
+        return self._params_dict
+
+    @property
+    def subgraph_hash(self) -> str:
+        """ Структурный хэш подграфа, питающего узел (типы, версии, параметры, связи) """
+        if self._subgraph_hash is None:
+            parts = [
+                type(self).__qualname__,
+                str(self.version),
+                repr(sorted(self.params_dict.items()))
+            ]
+            for input in self._inputs:
+                link = next((l for l in self.input_links if l.input is input), None)
+                if link is None:
+                    parts.append(f"{input.key}:-")
+                else:
+                    parent = link.output.node
+                    output_idx = parent._outputs.index(link.output)
+                    parts.append(f"{input.key}:{output_idx}:{parent.subgraph_hash}")
+            self._subgraph_hash = hashlib.sha1("|".join(parts).encode()).hexdigest()
+        return self._subgraph_hash
 
     @params_dict.setter
     def params_dict(self, data: dict[str, Any]) -> None:
@@ -143,6 +187,8 @@ class Node:
         dpg.push_container_stack(parent)
         dpg.unstage(self._stage)
         dpg.pop_container_stack()
+        # unstage переносит только дочерние элементы, пустой stage удаляется отдельно
+        dpg.delete_item(self._stage)
 
     def add_param(self, key: str, editor: ValueEditor) -> None:
         with dpg.node_attribute(parent=self._tag, attribute_type=dpg.mvNode_Attr_Static) as attr:
@@ -157,13 +203,14 @@ class Node:
             dpg.move_item(widget, parent=attr)
             self._widgets.append(widget)
 
-    def add_input_link(self, link: Node.Link) -> None:
+    def add_input_link(self, link: Node.Link, notify: bool = True) -> None:
         if link.input not in self._inputs:
             raise ValueError("link.input not in self._inputs")
         if link.input in self.busy_inputs:
             raise ValueError("link.input in self.busy_inputs")
         self._links.append(link)
-        self._on_input_connected(link.input)
+        if notify:
+            self._on_input_connected(link.input)
 
     def remove_input_link(self, link: Node.Link) -> None:
         if link not in self.input_links:
@@ -202,31 +249,108 @@ class Node:
         )
 
     def paint(self, r: int, g: int, b: int) -> None:
-        with dpg.theme() as theme:
-            with dpg.theme_component(dpg.mvNode):
-                dpg.add_theme_color(dpg.mvNodeCol_TitleBar, (r, g, b), category=dpg.mvThemeCat_Nodes)
-        dpg.bind_item_theme(self._tag, theme)
+        # Тема создается один раз, при повторной покраске меняется только цвет
+        if self._theme is None:
+            with dpg.theme() as self._theme:
+                with dpg.theme_component(dpg.mvNode):
+                    self._theme_color = dpg.add_theme_color(
+                        dpg.mvNodeCol_TitleBar, (r, g, b), category=dpg.mvThemeCat_Nodes
+                    )
+            dpg.bind_item_theme(self._tag, self._theme)
+        else:
+            dpg.set_value(self._theme_color, (r, g, b, 255))
+
+    def delete(self, items: bool = True) -> None:
+        """ Удалить элементы dearpygui узла и разорвать ссылки на другие узлы """
+        # Связи должны быть удалены через NodeEditor до вызова этого метода,
+        # здесь только очищаются ссылки, чтобы узел собирался без циклического GC.
+        # items=False - элементы узла уже удалены вместе с родителем, остается только тема
+        if items:
+            for item in (self._tag, self._stage):
+                if dpg.does_item_exist(item):
+                    dpg.delete_item(item)
+        if self._theme is not None:
+            dpg.delete_item(self._theme)
+            self._theme = None
+            self._theme_color = None
+        self._links.clear()
+        self._params.clear()
+        self._widgets.clear()
+        self._inputs.clear()
+        self._outputs.clear()
+        self._params_dict = None
 
     def _on_params_change(self) -> None:
+        self._params_dict = None
+        self._reset_subgraph_hash()
         for node in self.descendants:
             node._on_ancestor_change(self)
+        listener_ref = _params_listeners.get(self)
+        listener = listener_ref() if listener_ref is not None else None
+        if listener is not None:
+            listener(self)
 
     def _on_input_connected(self, input: Node.Input) -> None:
+        self._reset_subgraph_hash()
         for node in self.descendants:
             node._on_ancestor_change(self)
 
     def _on_input_disconnected(self, input: Node.Input) -> None:
+        self._reset_subgraph_hash()
         for node in self.descendants:
             node._on_ancestor_change(self)
 
     def _on_ancestor_change(self, ancestor: Node) -> None:
         pass
 
+    def _reset_subgraph_hash(self) -> None:
+        """ Сбросить хэш подграфа у узла и всех его потомков """
+        self._subgraph_hash = None
+        for node in self.descendants:
+            node._subgraph_hash = None
+
+    def _reset_caches(self) -> None:
+        """ Сбросить кэши только этого узла (без обхода потомков) """
+        self._params_dict = None
+        self._subgraph_hash = None
+
+
+# Подписчик на изменение параметров узла (NodeEditor._on_node_params_change).
+# Хранится вне Node, чтобы не попадать в состояние, сохраняемое jsonpickle
+_params_listeners: weakref.WeakKeyDictionary[Node, weakref.WeakMethod] = weakref.WeakKeyDictionary()
+
 
 class NodeEditor:
 
+    @dataclass
+    class Fragment:
+        """ Набор узлов со связями между ними, не зависящий от живых узлов редактора """
+        nodes: list[Node]  # Прототипы для Node.copy()
+        positions: list[list[int]]
+        params: list[dict[str, Any]]
+        links: list[tuple[int, int, int, str]]  # (индекс узла-родителя, индекс выхода, индекс узла, ключ входа)
+
+        @staticmethod
+        def from_nodes(nodes: list[Node],
+                       positions: list[list[int]],
+                       params: list[dict[str, Any]]
+                       ) -> NodeEditor.Fragment:
+            """ Связи с узлами вне nodes в фрагмент не попадают """
+            idx_by_id = {id(n): idx for idx, n in enumerate(nodes)}
+            links = []
+            for node_idx, node in enumerate(nodes):
+                for link in node.input_links:
+                    parent = link.output.node
+                    if id(parent) in idx_by_id:
+                        output_idx = list(parent.outputs).index(link.output)
+                        links.append((idx_by_id[id(parent)], output_idx, node_idx, link.input.key))
+            return NodeEditor.Fragment(nodes=list(nodes), positions=positions, params=params, links=links)
+
     def __init__(self):
         self._nodes: list[Node] = []
+        self._clipboard: Optional[NodeEditor.Fragment] = None
+        self._paste_count = 0
+        self._listeners: list[Callable[..., None]] = []
         with dpg.stage() as self._stage:
             self._tag = dpg.add_node_editor(
                 callback=self._on_link,
@@ -266,12 +390,35 @@ class NodeEditor:
         dpg.push_container_stack(parent)
         dpg.unstage(self._stage)
         dpg.pop_container_stack()
+        # unstage переносит только дочерние элементы, пустой stage удаляется отдельно
+        dpg.delete_item(self._stage)
+
+    def add_listener(self, listener: Callable[..., None]) -> None:
+        """
+        Подписаться на действия пользователя с редактором: listener(op, *args), где op одно из
+        add, link, delink, delete, clear, fragment, params, save
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[..., None]) -> None:
+        self._listeners.remove(listener)
 
     def clear(self) -> None:
+        self.emit("clear")
+        # Удаляются все узлы, поэтому связи и узлы удаляются одним вызовом без оповещения потомков
+        dpg.delete_item(self._tag, children_only=True)
         for node in self._nodes:
-            dpg.delete_item(node.tag)
+            node.delete(items=False)
         self._nodes.clear()
 
+    def delete(self) -> None:
+        """ Удалить все узлы и сам редактор """
+        self.clear()
+        self._clipboard = None
+        for item in (self._tag, self._stage):
+            if dpg.does_item_exist(item):
+                dpg.delete_item(item)
+
     def add_node(self, node: Node) -> None:
 
         node.add(parent=self._tag)
@@ -285,26 +432,121 @@ class NodeEditor:
 
         dpg.set_item_pos(node.tag, pos)
         self._nodes.append(node)
+        _params_listeners[node] = weakref.WeakMethod(self._on_node_params_change)
+        self.emit("add", node)
+
+    @property
+    def clipboard(self) -> Optional[NodeEditor.Fragment]:
+        return self._clipboard
+
+    @property
+    def selected_nodes(self) -> list[Node]:
+        selected = set(dpg.get_selected_nodes(self._tag))
+        return [n for n in self._nodes if n.tag in selected]
+
+    def copy_selection(self) -> None:
+        """ Скопировать выделенные узлы и связи между ними в буфер редактора """
+        nodes = self.selected_nodes
+        if not nodes:
+            return
+        self._clipboard = NodeEditor.Fragment.from_nodes(
+            nodes=nodes,
+            positions=[dpg.get_item_pos(n.tag) for n in nodes],
+            params=[dict(n.params_dict) for n in nodes]
+        )
+        self._paste_count = 0
+
+    def next_paste_offset(self) -> tuple[int, int]:
+        """ Сдвиг очередной вставки буфера относительно оригиналов """
+        self._paste_count += 1
+        offset = 40 * self._paste_count
+        return offset, offset
+
+    def paste(self) -> list[Node]:
+        """ Вставить узлы из буфера за один проход """
+        if self._clipboard is None:
+            return []
+        return self.add_fragment(self._clipboard, offset=self.next_paste_offset())
+
+    def duplicate_selection(self) -> list[Node]:
+        self.copy_selection()
+        return self.paste()
+
+    def add_fragment(self, fragment: NodeEditor.Fragment, offset: tuple[int, int] = (0, 0)) -> list[Node]:
+        """ Добавить фрагмент за один проход """
+        new_nodes = []
+        for new_nodes in self.iter_add_fragment(fragment, offset):
+            pass
+        return new_nodes
+
+    def iter_add_fragment(self,
+                          fragment: NodeEditor.Fragment,
+                          offset: tuple[int, int] = (0, 0)
+                          ) -> Iterator[list[Node]]:
+        """
+        Пакетное добавление фрагмента. Каждый узел строится один раз через Node.copy(),
+        параметры и связи выставляются без оповещения потомков: до окончания вставки
+        у новых узлов нет потомков вне фрагмента, поэтому в конце достаточно сбросить
+        кэши каждого узла. Генератор отдает список уже созданных узлов после каждого шага,
+        чтобы вызывающий код мог распределить вставку по кадрам.
+        Событие fragment отправляется до первого узла: подписчик получает список new_nodes,
+        который заполняется по мере вставки, и может ссылаться на узлы, добавленные частично
+        """
+
+        new_nodes: list[Node] = []
+        self.emit("fragment", fragment, offset, new_nodes)
+
+        for proto, pos, params in zip(fragment.nodes, fragment.positions, fragment.params):
+            node = proto.copy()
+            for param in node.params:
+                if param.key in params:
+                    param.value = params[param.key]
+            node.add(parent=self._tag)
+            dpg.set_item_pos(node.tag, [pos[0] + offset[0], pos[1] + offset[1]])
+            self._nodes.append(node)
+            _params_listeners[node] = weakref.WeakMethod(self._on_node_params_change)
+            new_nodes.append(node)
+            yield new_nodes
+
+        for output_node_idx, output_idx, input_node_idx, input_key in fragment.links:
+            # Узел мог быть удален пользователем, пока фрагмент добавлялся по кадрам
+            if not all(dpg.does_item_exist(new_nodes[idx].tag) for idx in (output_node_idx, input_node_idx)):
+                continue
+            output = list(new_nodes[output_node_idx].outputs)[output_idx]
+            input = [i for i in new_nodes[input_node_idx].inputs if i.key == input_key][0]
+            self.create_link(input, output, notify=False)
+            yield new_nodes
+
+        for node in new_nodes:
+            node._reset_caches()
+        yield new_nodes
 
     def delete_selection(self) -> None:
 
-        for link_tag in dpg.get_selected_links(self._tag):
-            link = [nl for nl in self.node_links if nl.tag == link_tag][0]
+        links_by_tag = {nl.tag: nl for nl in self.node_links}
+        links = [links_by_tag[link_tag] for link_tag in dpg.get_selected_links(self._tag)]
+        nodes = self.selected_nodes
+        self.emit("delete", links, nodes)
+
+        for link in links:
             self.remove_link(link)
 
-        for node_tag in dpg.get_selected_nodes(self._tag):
-            node = [n for n in self._nodes if n.tag == node_tag][0]
-            for link in node.links:
+        self.delete_nodes(nodes)
+
+    def delete_nodes(self, nodes: list[Node]) -> None:
+
+        for node in nodes:
+            for link in list(node.links):
                 if dpg.does_item_exist(link.tag):
                     self.remove_link(link)
 
-            dpg.delete_item(node_tag)
+            node.delete()
             self._nodes.remove(node)
 
-    def create_link(self, input: Node.Input, output: Node.Output) -> None:
+    def create_link(self, input: Node.Input, output: Node.Output, notify: bool = True) -> None:
         link_tag = dpg.add_node_link(output.tag, input.tag, parent=self._tag)
         link = Node.Link(tag=link_tag, input=input, output=output)
-        input.node.add_input_link(link)
+        input.node.add_input_link(link, notify=notify)
         output.node.add_output_link(link)
 
     def remove_link(self, link: Node.Link) -> None:
@@ -318,13 +560,27 @@ class NodeEditor:
         node_output = [no for no in self.node_outputs if no.tag == output_tag][0]
         if node_input in node_input.node.busy_inputs:
             return
+        self.emit("link", node_input, node_output)
         self.create_link(node_input, node_output)
 
     def _on_delink(self, sender, app_data):
         link_tag = app_data
         link = [nl for nl in self.node_links if nl.tag == link_tag][0]
+        self.emit("delink", link)
         self.remove_link(link)
 
+    def _on_node_params_change(self, node: Node) -> None:
+        self.emit("params", node)
+
+    def emit(self, op: str, *args) -> None:
+        """ Оповестить подписчиков о действии. Действия вне редактора (save) передает вызывающий код """
+        # Ошибка подписчика (например, записи трассы) не должна прерывать действие пользователя
+        for listener in self._listeners:
+            try:
+                listener(op, *args)
+            except Exception:
+                logger.exception(f"node editor listener failed on {op}")
+
 
 class NodeFreezer:
     """ Методы для сохранения состояния NodeEditor """
@@ -353,32 +609,15 @@ class NodeFreezer:
         )
 
     @staticmethod
-    def restore_editor_state(editor: NodeEditor, state: NodeFreezer.EditorState) -> None:
+    def get_fragment(state: NodeFreezer.EditorState) -> NodeEditor.Fragment:
+        """ Фрагмент для пакетного добавления сохраненного состояния в редактор """
+        return NodeEditor.Fragment.from_nodes(
+            nodes=[ns.obj for ns in state.nodes],
+            positions=[ns.pos for ns in state.nodes],
+            params=[ns.params_dict for ns in state.nodes]
+        )
 
+    @staticmethod
+    def restore_editor_state(editor: NodeEditor, state: NodeFreezer.EditorState) -> None:
         editor.clear()
-        old_2_new = {}  # NodeState.obj будут отличаться по tag, поэтому сопоставляем их словарем
-
-        # Восстанавливаем параметры и позиции узлов
-        for node_state in state.nodes:
-            old = node_state.obj
-            new = old.copy()
-            old_2_new[old] = new
-            editor.add_node(new)
-            dpg.set_item_pos(new.tag, node_state.pos)
-            new.params_dict = node_state.params_dict
-
-        # Восстанавливаем ссылки между узлами
-        for old, new in old_2_new.items():
-
-            for old_link in old.input_links:
-
-                old_input = old_link.input
-                new_input = [i for i in new.inputs if i.key == old_input.key][0]
-
-                old_output = old_link.output
-                old_parent = old_output.node
-                old_output_idx = list(old_parent.outputs).index(old_output)
-                new_parent = old_2_new[old_parent]
-                new_output = list(new_parent.outputs)[old_output_idx]
-
-                editor.create_link(new_input, new_output)
+        editor.add_fragment(NodeFreezer.get_fragment(state))
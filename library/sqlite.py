@@ -13,7 +13,9 @@ class SQLite:
 
         self.filepath = filepath
 
-        if init_stmt and not filepath.exists():
+        # Запросы инициализации выполняются при каждом запуске,
+        # поэтому должны быть идемпотентными (CREATE ... IF NOT EXISTS)
+        if init_stmt:
             with self.connection() as conn:
                 for stmt in init_stmt.split(";"):
                     conn.execute(stmt)
@@ -0,0 +1,275 @@
+""" Запись действий пользователя с NodeEditor в файл трассы и их воспроизведение
+
+Трасса - JSON Lines (со сжатием gzip, если имя файла оканчивается на .gz),
+одна операция на строку: [время от начала записи в секундах, операция, аргументы...].
+Узлы обозначаются номерами, которые назначает TraceRecorder
+"""
+
+import gzip
+import importlib
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Optional
+
+import dearpygui.dearpygui as dpg
+import jsonpickle
+
+from library.node_editor import Node, NodeEditor, NodeFreezer
+
+
+def _open(path: Path, mode: str) -> IO[str]:
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _class_path(node: Node) -> str:
+    return f"{type(node).__module__}:{type(node).__qualname__}"
+
+
+def _create_node(class_path: str) -> Node:
+    module_name, _, qualname = class_path.partition(":")
+    obj = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj()
+
+
+@dataclass
+class _PendingFragment:
+    """ Фрагмент, который еще добавляется: номера его узлов зарезервированы заранее """
+    nodes: list[Node]  # Заполняется NodeEditor.iter_add_fragment по мере вставки
+    first_id: int
+    count: int
+    assigned: int = 0
+
+
+class TraceRecorder:
+
+    def __init__(self, editor: NodeEditor, path: Path) -> None:
+        self._editor = editor
+        self._path = path
+        self._file: Optional[IO[str]] = None
+        self._started = 0.0
+        self._node_ids: dict[Node, int] = {}  # Только живые узлы, номера не переиспользуются
+        self._next_node_id = 0
+        self._pending: list[_PendingFragment] = []
+
+    @property
+    def recording(self) -> bool:
+        return self._file is not None
+
+    def start(self) -> None:
+        """ Начать запись. Текущие узлы редактора записываются первой операцией fragment """
+        self._file = _open(self._path, "w")
+        self._started = time.perf_counter()
+
+        nodes = list(self._editor.nodes)
+        fragment = NodeEditor.Fragment.from_nodes(
+            nodes=nodes,
+            positions=[dpg.get_item_pos(n.tag) for n in nodes],
+            params=[n.params_dict for n in nodes]
+        )
+        self._on_event("fragment", fragment, (0, 0), nodes)
+        self._editor.add_listener(self._on_event)
+
+    def stop(self) -> None:
+        self._editor.remove_listener(self._on_event)
+        self._file.close()
+        self._file = None
+        self._node_ids.clear()
+        self._pending.clear()
+
+    def _assign_pending(self) -> None:
+        """ Назначить зарезервированные номера узлам фрагментов, созданным с прошлого события """
+        for pending in list(self._pending):
+            for idx in range(pending.assigned, len(pending.nodes)):
+                self._node_ids[pending.nodes[idx]] = pending.first_id + idx
+            pending.assigned = len(pending.nodes)
+            if pending.assigned == pending.count:
+                self._pending.remove(pending)
+
+    def _node_id(self, node: Node) -> int:
+        self._assign_pending()
+        if node not in self._node_ids:
+            self._node_ids[node] = self._next_node_id
+            self._next_node_id += 1
+        return self._node_ids[node]
+
+    def _link_args(self, input: Node.Input, output: Node.Output) -> list:
+        return [
+            self._node_id(output.node),
+            list(output.node.outputs).index(output),
+            self._node_id(input.node),
+            input.key
+        ]
+
+    def _on_event(self, op: str, *args) -> None:
+
+        if op == "add":
+            node, = args
+            record = [self._node_id(node), _class_path(node)]
+        elif op == "link":
+            input, output = args
+            record = self._link_args(input, output)
+        elif op == "delink":
+            link, = args
+            record = self._link_args(link.input, link.output)
+        elif op == "delete":
+            links, nodes = args
+            record = [
+                [self._link_args(l.input, l.output) for l in links],
+                [self._node_id(n) for n in nodes]
+            ]
+            for node in nodes:
+                del self._node_ids[node]
+        elif op == "fragment":
+            fragment, offset, nodes = args
+            # Узлы еще не созданы (или созданы не все), номера резервируются на весь фрагмент
+            pending = _PendingFragment(nodes=nodes, first_id=self._next_node_id, count=len(fragment.nodes))
+            self._next_node_id += pending.count
+            self._pending.append(pending)
+            self._assign_pending()
+            record = [
+                [_class_path(n) for n in fragment.nodes],
+                fragment.positions,
+                jsonpickle.encode(fragment.params),
+                fragment.links,
+                list(offset),
+                list(range(pending.first_id, pending.first_id + pending.count))
+            ]
+        elif op == "params":
+            node, = args
+            record = [self._node_id(node), jsonpickle.encode(node.params_dict)]
+        elif op == "clear":
+            self._node_ids.clear()
+            self._pending.clear()
+            record = []
+        else:
+            record = []
+
+        t = round(time.perf_counter() - self._started, 6)
+        self._file.write(json.dumps([t, op, *record], separators=(",", ":")) + "\n")
+
+
+class TraceReplayer:
+    """
+    Воспроизведение трассы через API NodeEditor без окна.
+    Связи создаются и удаляются через те же callback'и, что вызывает dearpygui
+    """
+
+    def __init__(self, editor: NodeEditor, path: Path) -> None:
+        self._editor = editor
+        self._path = path
+        self._nodes: dict[int, Node] = {}
+
+    def run(self, realtime: bool = False) -> dict[str, list[float]]:
+        """ Воспроизвести трассу. realtime=True выдерживает паузы между операциями как при записи """
+
+        latencies: dict[str, list[float]] = {}
+        started = time.perf_counter()
+
+        with _open(self._path, "r") as file:
+            for line in file:
+                t, op, *args = json.loads(line)
+                if realtime:
+                    delay = started + t - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                latencies.setdefault(op, []).append(self._replay(op, args))
+
+        return latencies
+
+    def _find_link(self, output_node_id: int, output_idx: int, input_node_id: int, input_key: str) -> Node.Link:
+        output = list(self._nodes[output_node_id].outputs)[output_idx]
+        return [l for l in self._nodes[input_node_id].input_links if l.input.key == input_key and l.output is output][0]
+
+    def _replay(self, op: str, args: list) -> float:
+        """ Выполнить операцию и вернуть ее длительность в секундах """
+
+        editor = self._editor
+
+        if op == "add":
+            node_id, class_path = args
+            started = time.perf_counter()
+            node = _create_node(class_path)
+            editor.add_node(node)
+            self._nodes[node_id] = node
+
+        elif op == "link":
+            output_node_id, output_idx, input_node_id, input_key = args
+            output = list(self._nodes[output_node_id].outputs)[output_idx]
+            input = [i for i in self._nodes[input_node_id].inputs if i.key == input_key][0]
+            started = time.perf_counter()
+            editor._on_link(None, (output.tag, input.tag))
+
+        elif op == "delink":
+            link = self._find_link(*args)
+            started = time.perf_counter()
+            editor._on_delink(None, link.tag)
+
+        elif op == "delete":
+            link_args, node_ids = args
+            links = [self._find_link(*la) for la in link_args]
+            started = time.perf_counter()
+            for link in links:
+                editor.remove_link(link)
+            editor.delete_nodes([self._nodes.pop(node_id) for node_id in node_ids])
+
+        elif op == "clear":
+            started = time.perf_counter()
+            editor.clear()
+            self._nodes.clear()
+
+        elif op == "fragment":
+            class_paths, positions, params, links, offset, node_ids = args
+            fragment = NodeEditor.Fragment(
+                nodes=[_create_node(cp) for cp in class_paths],
+                positions=positions,
+                params=jsonpickle.decode(params),
+                links=[tuple(link) for link in links]
+            )
+            started = time.perf_counter()
+            new_nodes = editor.add_fragment(fragment, offset=tuple(offset))
+            finished = time.perf_counter()
+            self._nodes.update(zip(node_ids, new_nodes))
+            for proto in fragment.nodes:
+                proto.delete()
+            return finished - started
+
+        elif op == "params":
+            node_id, params = args
+            params = jsonpickle.decode(params)
+            started = time.perf_counter()
+            self._nodes[node_id].params_dict = params
+
+        elif op == "save":
+            started = time.perf_counter()
+            editor.emit("save")
+            jsonpickle.encode(NodeFreezer.get_editor_state(editor))
+
+        else:
+            raise ValueError(f"unknown trace operation: {op}")
+
+        return time.perf_counter() - started
+
+
+def percentiles(latencies: dict[str, list[float]]) -> dict[str, dict[str, Any]]:
+    """ Количество и перцентили задержек по операциям, в миллисекундах """
+
+    def pick(values: list[float], q: float) -> float:
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+    report = {}
+    for op, values in latencies.items():
+        values = sorted(values)
+        report[op] = {
+            "count": len(values),
+            "p50": pick(values, 0.5),
+            "p90": pick(values, 0.9),
+            "p99": pick(values, 0.99),
+            "max": values[-1] * 1000
+        }
+    return report
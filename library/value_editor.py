@@ -1,3 +1,5 @@
+import inspect
+import weakref
 from abc import abstractmethod, ABC
 from enum import Enum, EnumMeta
 from typing import Any, Callable, Optional
@@ -6,36 +8,80 @@ import dearpygui.dearpygui as dpg
 
 
 class ValueEditor(ABC):
+    """
+    Редактор значения. Хранит теневую копию значения, уже приведенную к нужному типу,
+    поэтому чтение value не обращается к dearpygui. Копия обновляется в callback элемента
+    и при установке value. Наследники вызывают _init_value() после создания элемента
+    """
 
     @abstractmethod
     def __init__(self, **kwargs) -> None:
         self._stage: int = ...
         self._tag: int = ...
 
+    def __getstate__(self) -> dict:
+        # callback не сохраняется вместе с редактором (например, в состоянии NodeEditor)
+        state = self.__dict__.copy()
+        state.pop("_callback", None)
+        return state
+
     @property
     def tag(self) -> int:
         return self._tag
 
     @property
     def callback(self) -> Optional[Callable]:
-        return dpg.get_item_callback(self._tag)
+        if isinstance(self._callback, weakref.WeakMethod):
+            return self._callback()
+        return self._callback
 
     @callback.setter
     def callback(self, callback: Optional[Callable]) -> None:
-        dpg.set_item_callback(self._tag, callback)
+        # Метод владельца (например, Node) хранится по слабой ссылке,
+        # чтобы редактор не образовывал с ним цикл ссылок
+        if inspect.ismethod(callback):
+            self._callback = weakref.WeakMethod(callback)
+        else:
+            self._callback = callback
+        self._callback_argc = len(inspect.signature(callback).parameters) if callback else 0
 
     @property
     def value(self) -> Optional[Any]:
-        return dpg.get_value(self._tag)
+        return self._value
 
     @value.setter
     def value(self, value: Optional[Any]):
-        dpg.set_value(self._tag, value)
+        dpg_value = self._to_dpg(value)
+        dpg.set_value(self._tag, dpg_value)
+        self._value = self._from_dpg(dpg_value)
 
     def add(self, parent) -> None:
         dpg.push_container_stack(parent)
         dpg.unstage(self._stage)
         dpg.pop_container_stack()
+        # unstage переносит только дочерние элементы, пустой stage удаляется отдельно
+        dpg.delete_item(self._stage)
+
+    def _init_value(self) -> None:
+        """ Заполнить теневую копию значения и перехватить callback элемента """
+        self._value = self._from_dpg(dpg.get_value(self._tag))
+        self.callback = dpg.get_item_callback(self._tag)
+        dpg.set_item_callback(self._tag, self._on_item_change)
+
+    def _on_item_change(self, sender, app_data, user_data) -> None:
+        self._value = self._from_dpg(app_data)
+        callback = self.callback
+        if callback is not None:
+            # dearpygui передает в callback столько аргументов, сколько он принимает
+            callback(*(sender, app_data, user_data)[:self._callback_argc])
+
+    def _to_dpg(self, value: Optional[Any]) -> Any:
+        """ Значение редактора -> значение элемента dearpygui """
+        return value
+
+    def _from_dpg(self, dpg_value: Any) -> Optional[Any]:
+        """ Значение элемента dearpygui -> значение редактора """
+        return dpg_value
 
 
 class IntInput(ValueEditor):
@@ -43,14 +89,7 @@ class IntInput(ValueEditor):
     def __init__(self, **kwargs) -> None:
         with dpg.stage() as self._stage:
             self._tag = dpg.add_input_int(**kwargs)
-
-    @property
-    def value(self) -> int:
-        return dpg.get_value(self._tag)
-
-    @value.setter
-    def value(self, value: int):
-        dpg.set_value(self._tag, value)
+        self._init_value()
 
 
 class PositiveIntInput(ValueEditor):
@@ -59,14 +98,13 @@ class PositiveIntInput(ValueEditor):
         kwargs["default_value"] = kwargs.get("default_value") or 0
         with dpg.stage() as self._stage:
             self._tag = dpg.add_input_int(**kwargs)
+        self._init_value()
 
-    @property
-    def value(self) -> Optional[int]:
-        return dpg.get_value(self._tag) or None
+    def _to_dpg(self, value: Optional[int]) -> int:
+        return value or 0
 
-    @value.setter
-    def value(self, value: Optional[int]):
-        dpg.set_value(self._tag, value or 0)
+    def _from_dpg(self, dpg_value: int) -> Optional[int]:
+        return dpg_value or None
 
 
 class Combobox(ValueEditor):
@@ -88,14 +126,13 @@ class Combobox(ValueEditor):
 
         with dpg.stage() as self._stage:
             self._tag = dpg.add_combo(**kwargs)
+        self._init_value()
 
-    @property
-    def value(self) -> Optional[Any]:
-        return self._value_from_str(dpg.get_value(self._tag))
+    def _to_dpg(self, value: Optional[Any]) -> str:
+        return self._value_to_str(value)
 
-    @value.setter
-    def value(self, value: Optional[Any]):
-        dpg.set_value(self._tag, self._value_to_str(value))
+    def _from_dpg(self, dpg_value: str) -> Optional[Any]:
+        return self._value_from_str(dpg_value)
 
     @staticmethod
     def _value_to_str(value: Optional[Any]) -> str:
@@ -148,11 +185,7 @@ class Checkbox(ValueEditor):
         kwargs["default_value"] = kwargs.get("default_value") or False
         with dpg.stage() as self._stage:
             self._tag = dpg.add_checkbox(**kwargs)
+        self._init_value()
 
-    @property
-    def value(self) -> bool:
-        return dpg.get_value(self._tag)
-
-    @value.setter
-    def value(self, val: Optional[bool]):
-        dpg.set_value(self._tag, val)
+    def _to_dpg(self, value: Optional[bool]) -> bool:
+        return bool(value)
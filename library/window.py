@@ -16,6 +16,13 @@ class Window(ABC):
 
     def add(self) -> None:
         dpg.unstage(self._stage)
+        dpg.delete_item(self._stage)
+
+    def delete(self) -> None:
+        """ Удалить окно со всеми дочерними элементами """
+        for item in (self._tag, self._stage):
+            if dpg.does_item_exist(item):
+                dpg.delete_item(item)
 
     def center(self) -> None:
         dpg.set_item_pos(
@@ -1,22 +1,42 @@
+import time
+_started = time.perf_counter()
+
 import dearpygui.dearpygui as dpg
 from loguru import logger
 
-from ui import CalculatorWindow
-
 
 logger.add("error.log", format="{time} {level} {message}", level="ERROR")
+logger.add("startup.log", format="{time} {message}", filter=lambda record: "startup" in record["extra"])
+
+_imported = time.perf_counter()
+
+
+def open_calculator() -> None:
+    # Модуль ui (узлы, БД, адаптеры jsonpickle) загружается при первом открытии окна
+    from ui import CalculatorWindow
+    CalculatorWindow().add()
 
 
 def main():
 
     dpg.create_context()
+    context_created = time.perf_counter()
+
+    def report_startup_timing() -> None:
+        first_frame = time.perf_counter()
+        logger.bind(startup=True).info(
+            f"import: {_imported - _started:.3f}s, "
+            f"context: {context_created - _imported:.3f}s, "
+            f"first frame: {first_frame - context_created:.3f}s"
+        )
 
     with dpg.viewport_menu_bar():
         with dpg.menu(label="Menu"):
-            dpg.add_menu_item(label="Calculator", callback=lambda: CalculatorWindow().add)
+            dpg.add_menu_item(label="Calculator", callback=open_calculator)
 
     dpg.create_viewport(title='Node Editor Example')
     dpg.setup_dearpygui()
+    dpg.set_frame_callback(1, report_startup_timing)
     dpg.show_viewport()
     dpg.maximize_viewport()
     dpg.start_dearpygui()
@@ -0,0 +1,227 @@
+""" Оптимизация графа вычислений калькулятора
+
+Граф узлов NodeEditor компилируется в отдельный граф выражений, визуальный граф не меняется:
+    - подграфы из констант сворачиваются в одну константу
+    - структурно одинаковые подвыражения объединяются (hash-consing)
+    - узлы, от которых не зависит ни один ResultNode, отбрасываются
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+from library.node_editor import Node, NodeEditor
+from ui import NumberNode, OperatorNode, ResultNode, StreamResultNode, is_stream
+
+
+@dataclass(eq=False)
+class Const:
+    value: Any
+
+    @property
+    def key(self) -> tuple:
+        return "const", type(self.value), self.value
+
+    @property
+    def args(self) -> tuple:
+        return ()
+
+
+@dataclass(eq=False)
+class Operation:
+    operation: str
+    args: tuple[Expr, Expr]
+
+    @property
+    def key(self) -> tuple:
+        return "op", self.operation, *(id(a) for a in self.args)
+
+
+@dataclass(eq=False)
+class Opaque:
+    """ Узел, который оптимизатор не разбирает и вычисляет через Node.value """
+    node: Node
+
+    @property
+    def key(self) -> tuple:
+        return "node", id(self.node)
+
+    @property
+    def args(self) -> tuple:
+        return ()
+
+
+Expr = Const | Operation | Opaque
+
+
+@dataclass
+class OptimizationReport:
+    nodes_before: int
+    nodes_after: int
+    folded: int
+    merged: int
+    dead: int
+    stream: int  # Узлы, которые питают только StreamResultNode: не оптимизируются и не входят в nodes_before
+    naive_seconds: float
+    optimized_seconds: float
+
+    def __str__(self) -> str:
+        return "\n".join([
+            f"nodes: {self.nodes_before} -> {self.nodes_after} "
+            f"(eliminated {self.nodes_before - self.nodes_after})",
+            f"constant folded: {self.folded}",
+            f"merged subexpressions: {self.merged}",
+            f"dead nodes: {self.dead}",
+            f"stream-only nodes (not optimized): {self.stream}",
+            f"evaluation: {self.naive_seconds:.6f}s -> {self.optimized_seconds:.6f}s"
+        ])
+
+
+class GraphOptimizer:
+
+    def __init__(self) -> None:
+        self._exprs: dict[tuple, Expr] = {}  # Структурный ключ -> выражение
+        self._compiled: dict[Node, Expr] = {}
+        self.folded = 0
+        self.merged = 0
+
+    def compile(self, node: Node) -> Expr:
+        """ Выражение, эквивалентное значению узла """
+
+        if node in self._compiled:
+            return self._compiled[node]
+
+        if isinstance(node, NumberNode):
+            expr = self._intern(Const(node.value))
+        elif isinstance(node, OperatorNode) and not is_stream(node):
+            expr = self._compile_operator(node)
+        else:
+            expr = self._intern(Opaque(node))
+
+        self._compiled[node] = expr
+        return expr
+
+    def _compile_operator(self, node: OperatorNode) -> Expr:
+
+        parents = node.operands()
+        if None in parents:
+            return self._intern(Opaque(node))
+
+        operation = node.params_dict["operation"]
+        args = tuple(self.compile(p) for p in parents)
+
+        if all(isinstance(a, Const) for a in args):
+            try:
+                value = OperatorNode.OPERATIONS[operation](*(a.value for a in args))
+            except ArithmeticError:
+                # Ошибку оставляем на момент вычисления, как и без оптимизации
+                pass
+            else:
+                self.folded += 1
+                return self._intern(Const(value))
+
+        return self._intern(Operation(operation, args))
+
+    def _intern(self, expr: Expr) -> Expr:
+        key = expr.key
+        if key in self._exprs:
+            self.merged += 1
+            return self._exprs[key]
+        self._exprs[key] = expr
+        return expr
+
+
+def evaluate(expr: Expr, memo: dict[int, Any]) -> Any:
+    """ Значение выражения. Общие подвыражения вычисляются один раз """
+    if id(expr) not in memo:
+        if isinstance(expr, Const):
+            memo[id(expr)] = expr.value
+        elif isinstance(expr, Operation):
+            args = [evaluate(a, memo) for a in expr.args]
+            memo[id(expr)] = OperatorNode.OPERATIONS[expr.operation](*args)
+        else:
+            memo[id(expr)] = expr.node.value
+    return memo[id(expr)]
+
+
+def evaluate_naive(node: Node) -> Any:
+    """ Значение узла обходом исходного графа, без оптимизаций и кэша """
+    if isinstance(node, OperatorNode) and not is_stream(node):
+        parent_1, parent_2 = node.operands()
+        func = OperatorNode.OPERATIONS[node.params_dict["operation"]]
+        return func(evaluate_naive(parent_1), evaluate_naive(parent_2))
+    return node.value
+
+
+def reachable(nodes: list[Node]) -> set[Node]:
+    """ Узлы nodes и все их предки """
+    seen = set()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if node not in seen:
+            seen.add(node)
+            stack.extend(node.parents)
+    return seen
+
+
+def walk(exprs: list[Expr]) -> Iterator[Expr]:
+    """ Уникальные выражения, достижимые из exprs """
+    seen = set()
+    stack = list(exprs)
+    while stack:
+        expr = stack.pop()
+        if id(expr) in seen:
+            continue
+        seen.add(id(expr))
+        yield expr
+        stack.extend(expr.args)
+
+
+def evaluate_optimized(editor: NodeEditor) -> tuple[dict[ResultNode, Any], OptimizationReport]:
+    """ Вычислить все ResultNode по оптимизированному графу. Ошибки возвращаются как значения """
+
+    all_result_nodes = [n for n in editor.nodes if isinstance(n, ResultNode)]
+    result_nodes = [n for n in all_result_nodes if not isinstance(n, StreamResultNode)]
+    parents: dict[ResultNode, Optional[Node]] = {r: next(r.parents, None) for r in result_nodes}
+    source_nodes = [n for n in editor.nodes if not isinstance(n, ResultNode)]
+
+    started = time.perf_counter()
+    for parent in parents.values():
+        if parent is not None:
+            try:
+                evaluate_naive(parent)
+            except Exception:
+                pass
+    naive_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    optimizer = GraphOptimizer()
+    exprs = {r: optimizer.compile(p) for r, p in parents.items() if p is not None}
+    memo = {}
+    results = {}
+    for result_node, expr in exprs.items():
+        try:
+            results[result_node] = evaluate(expr, memo)
+        except Exception as e:
+            results[result_node] = e
+    optimized_seconds = time.perf_counter() - started
+
+    # Живые узлы питают хотя бы один ResultNode, включая потоковые
+    live = reachable([p for r in all_result_nodes for p in r.parents])
+    optimized = reachable([p for p in parents.values() if p is not None])
+    stream_only = live - optimized
+
+    report = OptimizationReport(
+        nodes_before=len([n for n in source_nodes if n not in stream_only]),
+        nodes_after=len(list(walk(list(exprs.values())))),
+        folded=optimizer.folded,
+        merged=optimizer.merged,
+        dead=len([n for n in source_nodes if n not in live]),
+        stream=len(stream_only),
+        naive_seconds=naive_seconds,
+        optimized_seconds=optimized_seconds
+    )
+    return results, report
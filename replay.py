@@ -0,0 +1,43 @@
+""" Воспроизведение трассы действий в NodeEditor без окна и отчет о задержках операций
+
+Примеры:
+    python replay.py trace.jsonl.gz              # максимальная скорость
+    python replay.py trace.jsonl.gz --realtime   # с паузами как при записи
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Optional
+
+import dearpygui.dearpygui as dpg
+
+from library.node_editor import NodeEditor
+from library.trace import TraceReplayer, percentiles
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(description="Воспроизведение трассы действий в NodeEditor")
+    parser.add_argument("trace", type=Path, help="файл трассы")
+    parser.add_argument("--realtime", action="store_true", help="выдерживать паузы между операциями")
+    args = parser.parse_args(argv)
+
+    dpg.create_context()
+    editor = NodeEditor()
+    latencies = TraceReplayer(editor, args.trace).run(realtime=args.realtime)
+    editor.delete()
+    dpg.destroy_context()
+
+    print(f"{'op':<10} {'count':>7} {'p50, ms':>10} {'p90, ms':>10} {'p99, ms':>10} {'max, ms':>10}")
+    for op, stats in percentiles(latencies).items():
+        print(
+            f"{op:<10} {stats['count']:>7} {stats['p50']:>10.3f} "
+            f"{stats['p90']:>10.3f} {stats['p99']:>10.3f} {stats['max']:>10.3f}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
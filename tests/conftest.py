@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+import dearpygui.dearpygui as dpg
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(autouse=True)
+def dpg_context(tmp_path, monkeypatch):
+    """ Контекст dearpygui без viewport и рабочая папка с чистой main.db """
+    from database import get_db
+    monkeypatch.chdir(tmp_path)
+    get_db.cache_clear()
+    dpg.create_context()
+    yield
+    dpg.destroy_context()
+    get_db.cache_clear()
@@ -0,0 +1,24 @@
+import batch
+from database import get_db
+from library.node_editor import NodeEditor, NodeFreezer
+from test_presets import build_chain
+
+
+def test_run_preset_reports_errors_with_name_and_timing(monkeypatch):
+    editor = NodeEditor()
+    build_chain(editor, n_ops=1)
+    good = get_db().insert_node_editor_state("good", NodeFreezer.get_editor_state(editor))
+    with get_db().connection() as conn:
+        conn.execute("INSERT INTO node_editor_state(name, state) VALUES ('corrupt', X'7b7b')")
+        corrupt = conn.execute("SELECT last_insert_rowid() AS rowid").fetchone()["rowid"]
+
+    monkeypatch.setattr(batch, "_editor", NodeEditor())
+    reports = {rowid: batch.run_preset(rowid) for rowid in (good, corrupt, corrupt + 1)}
+
+    assert reports[good]["error"] is None
+    assert reports[good]["results"][0]["value"] == 6 + 1
+    assert reports[corrupt]["name"] == "corrupt"
+    assert "JSONDecodeError" in reports[corrupt]["error"]
+    assert reports[corrupt + 1]["error"] == "preset not found"
+    for report in reports.values():
+        assert report["load_seconds"] >= 0 and report["eval_seconds"] >= 0
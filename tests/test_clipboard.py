@@ -0,0 +1,39 @@
+import dearpygui.dearpygui as dpg
+
+import ui
+from library.node_editor import NodeEditor
+from test_presets import build_chain
+
+
+def test_copy_and_paste_selection(monkeypatch):
+    editor = NodeEditor()
+    original_result = build_chain(editor, n_ops=1)  # 6, 1, +, result
+    selection = list(editor.nodes)[:3]  # Без result: связь + -> result внешняя
+
+    tags = [n.tag for n in selection]
+    monkeypatch.setattr(dpg, "get_selected_nodes", lambda editor_tag: tags)
+    editor.copy_selection()
+
+    first = editor.paste()
+    second = editor.paste()
+
+    for pasted, offset in ((first, 40), (second, 80)):
+        assert [type(n) for n in pasted] == [type(n) for n in selection]
+        for node, original in zip(pasted, selection):
+            x, y = dpg.get_item_pos(original.tag)
+            assert dpg.get_item_pos(node.tag) == [x + offset, y + offset]
+
+        # Внутренние связи переназначены на вставленные узлы, внешняя отброшена
+        number_1, number_2, operator = pasted
+        assert operator.operands() == (number_1, number_2)
+        assert not list(operator.output_links)
+
+    result = ui.ResultNode()
+    editor.add_node(result)
+    editor.create_link(result._inputs[0], first[2]._outputs[0])
+    assert result.evaluate() == 6 + 1
+
+    first[1].params_dict = {"number": 50}
+    assert result.evaluate() == 6 + 50
+    assert original_result.evaluate() == 6 + 1
+    assert len(list(editor.nodes)) == 4 + 3 + 3 + 1
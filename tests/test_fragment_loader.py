@@ -0,0 +1,38 @@
+import time
+
+import dearpygui.dearpygui as dpg
+
+import ui
+from library import fragment_loader
+from library.fragment_loader import FragmentLoader
+from library.node_editor import NodeEditor
+from test_presets import build_chain
+
+
+def run_frames() -> None:
+    # Без viewport frame callback'и не вызываются, кадры прокручиваются вручную
+    while fragment_loader._active:
+        fragment_loader._on_frame()
+        time.sleep(0.001)
+
+
+def test_concurrent_loaders_all_finish():
+    source = NodeEditor()
+    build_chain(source, n_ops=20)
+    nodes = list(source.nodes)
+    fragment = NodeEditor.Fragment.from_nodes(
+        nodes=nodes,
+        positions=[dpg.get_item_pos(n.tag) for n in nodes],
+        params=[n.params_dict for n in nodes]
+    )
+
+    editors = [NodeEditor(), NodeEditor()]
+    finished = []
+    for editor in editors:
+        FragmentLoader(editor, lambda: fragment, frame_budget=0.001, on_finish=finished.append).start()
+    run_frames()
+
+    assert finished == [True, True]
+    for editor in editors:
+        result, = [n for n in editor.nodes if isinstance(n, ui.ResultNode)]
+        assert result.evaluate() == 6 + sum(range(1, 21))
@@ -0,0 +1,59 @@
+import ui
+from library.node_editor import Node, NodeEditor
+from optimizer import evaluate_optimized
+
+
+def number(editor: NodeEditor, value: int) -> ui.NumberNode:
+    node = ui.NumberNode()
+    editor.add_node(node)
+    node.params_dict = {"number": value}
+    return node
+
+
+def operator(editor: NodeEditor, operation: str, parent_1: Node, parent_2: Node) -> ui.OperatorNode:
+    node = ui.OperatorNode()
+    editor.add_node(node)
+    node.params_dict = {"operation": operation}
+    editor.create_link(node._inputs[0], parent_1._outputs[0])
+    editor.create_link(node._inputs[1], parent_2._outputs[0])
+    return node
+
+
+def result(editor: NodeEditor, parent: Node, node_cls: type = ui.ResultNode) -> ui.ResultNode:
+    node = node_cls()
+    editor.add_node(node)
+    editor.create_link(node._inputs[0], parent._outputs[0])
+    return node
+
+
+def test_evaluate_optimized():
+    editor = NodeEditor()
+
+    # (a + b) * (a + b): две копии суммы объединяются, все сворачивается в константу
+    a, b = number(editor, 2), number(editor, 3)
+    product = operator(editor, "*", operator(editor, "+", a, b), operator(editor, "+", a, b))
+    product_result = result(editor, product)
+
+    # Мертвая ветка: не питает ни один ResultNode
+    operator(editor, "-", number(editor, 7), a)
+
+    # Потоковая ветка: живая, но не оптимизируется
+    range_node = ui.RangeNode()
+    editor.add_node(range_node)
+    result(editor, operator(editor, "*", range_node, number(editor, 2)), ui.StreamResultNode)
+
+    # Деление на ноль не сворачивается, ошибка возвращается как значение
+    division_result = result(editor, operator(editor, "/", number(editor, 1), number(editor, 0)))
+
+    results, report = evaluate_optimized(editor)
+
+    assert results[product_result] == 25
+    assert isinstance(results[division_result], ZeroDivisionError)
+    assert len(results) == 2
+
+    assert report.folded == 3
+    assert report.merged == 1
+    assert report.dead == 2
+    assert report.stream == 3
+    assert report.nodes_before == 10
+    assert report.nodes_after == 4  # 25 и операция 1 / 0 со своими аргументами
@@ -0,0 +1,61 @@
+import ui
+from database import get_db
+from library.node_editor import NodeEditor, NodeFreezer
+
+
+def build_chain(editor: NodeEditor, n_ops: int = 3) -> ui.ResultNode:
+    """ number -> (+ number) x n_ops -> result """
+
+    prev = ui.NumberNode()
+    editor.add_node(prev)
+    prev.params_dict = {"number": 6}
+
+    for i in range(n_ops):
+        number = ui.NumberNode()
+        editor.add_node(number)
+        number.params_dict = {"number": i + 1}
+        operator = ui.OperatorNode()
+        editor.add_node(operator)
+        operator.params_dict = {"operation": "+"}
+        editor.create_link(operator._inputs[0], prev._outputs[0])
+        editor.create_link(operator._inputs[1], number._outputs[0])
+        prev = operator
+
+    result = ui.ResultNode()
+    editor.add_node(result)
+    editor.create_link(result._inputs[0], prev._outputs[0])
+    return result
+
+
+def test_save_load_round_trip():
+    editor = NodeEditor()
+    result = build_chain(editor)
+    assert result.evaluate() == 12
+
+    rowid = get_db().insert_node_editor_state("preset", NodeFreezer.get_editor_state(editor))
+    state = get_db().select_node_editor_state(rowid)["state"]
+
+    restored = NodeEditor()
+    NodeFreezer.restore_editor_state(restored, state)
+
+    assert len(list(restored.nodes)) == len(list(editor.nodes))
+    result, = [n for n in restored.nodes if isinstance(n, ui.ResultNode)]
+    assert result.evaluate() == 12
+
+
+def test_restored_nodes_notify_editor():
+    editor = NodeEditor()
+    build_chain(editor, n_ops=1)
+    rowid = get_db().insert_node_editor_state("preset", NodeFreezer.get_editor_state(editor))
+
+    restored = NodeEditor()
+    NodeFreezer.restore_editor_state(restored, get_db().select_node_editor_state(rowid)["state"])
+
+    events = []
+    restored.add_listener(lambda op, *args: events.append(op))
+    number = next(n for n in restored.nodes if isinstance(n, ui.NumberNode))
+    number.params_dict = {"number": 10}
+
+    assert events == ["params"]
+    result, = [n for n in restored.nodes if isinstance(n, ui.ResultNode)]
+    assert result.evaluate() == 10 + 1
@@ -0,0 +1,36 @@
+import database
+from database import get_db
+from library.node_editor import NodeEditor
+from test_presets import build_chain
+
+
+def test_chain_evaluation_fills_and_hits_cache():
+    editor = NodeEditor()
+    result = build_chain(editor, n_ops=10)
+    assert result.evaluate() == 6 + sum(range(1, 11))
+
+    with get_db().connection() as conn:
+        assert conn.execute("SELECT COUNT(*) AS n FROM result_cache").fetchone()["n"] == 10
+
+    head = next(editor.nodes)
+    head.params_dict = {"number": 100}
+    assert result.evaluate() == 100 + sum(range(1, 11))
+    head.params_dict = {"number": 6}
+    assert result.evaluate() == 6 + sum(range(1, 11))
+
+
+def test_eviction_keeps_cache_bounded(monkeypatch):
+    db = get_db()
+    monkeypatch.setattr(db, "result_cache_size", 10)
+    monkeypatch.setattr(db, "result_cache_evict_every", 5)
+    # Одинаковое время у всех записей: граница вытеснения не должна зависеть от accessed
+    monkeypatch.setattr(database.time, "time", lambda: 1000.0)
+
+    with db.result_cache_session():
+        for i in range(500):
+            db.insert_result_cache(f"key{i}", i, ["OperatorNode"])
+
+    with db.connection() as conn:
+        keys = [row["key"] for row in conn.execute("SELECT key FROM result_cache")]
+    assert len(keys) <= 10 + 5
+    assert "key499" in keys and "key0" not in keys
@@ -0,0 +1,31 @@
+import jsonpickle
+
+import database
+from database import get_db
+from library.node_editor import NodeEditor, NodeFreezer
+from test_presets import build_chain
+
+
+def test_corrupt_presets_do_not_block_db(monkeypatch):
+    editor = NodeEditor()
+    build_chain(editor, n_ops=1)
+    get_db().insert_node_editor_state("good", NodeFreezer.get_editor_state(editor))
+
+    with get_db().connection() as conn:
+        stmt = "INSERT INTO node_editor_state(name, state) VALUES (?, ?)"
+        conn.execute(stmt, ("not json", b"{{"))
+        conn.execute(stmt, ("wrong shape", jsonpickle.encode(NodeFreezer.EditorState(nodes=5)).encode()))
+        conn.execute("DELETE FROM preset_stats")
+
+    decoded = []
+    decode = jsonpickle.decode
+    monkeypatch.setattr(database.jsonpickle, "decode", lambda s: decoded.append(s) or decode(s))
+
+    get_db.cache_clear()
+    assert [row["name"] for row in get_db().search_node_editor_states()] == ["good"]
+    assert len(decoded) == 3
+
+    # Непроиндексированные пресеты отмечены и не декодируются повторно
+    get_db.cache_clear()
+    get_db()
+    assert len(decoded) == 3
@@ -0,0 +1,73 @@
+import pytest
+
+import ui
+from library.node_editor import NodeEditor
+from test_optimizer import number, operator, result
+
+
+def range_node(editor, start: int, stop: int, step: int = 1) -> ui.RangeNode:
+    node = ui.RangeNode()
+    editor.add_node(node)
+    node.params_dict = {"start": start, "stop": stop, "step": step}
+    return node
+
+
+@pytest.fixture
+def chunk_sizes(monkeypatch) -> list[int]:
+    """ Размеры порций, которые отдали все RangeNode """
+    sizes = []
+    stream = ui.RangeNode.stream
+
+    def spy(self, chunk_size):
+        for chunk in stream(self, chunk_size):
+            sizes.append(len(chunk))
+            yield chunk
+
+    monkeypatch.setattr(ui.RangeNode, "stream", spy)
+    return sizes
+
+
+@pytest.fixture
+def editor() -> NodeEditor:
+    return NodeEditor()
+
+
+def test_large_range_is_streamed_in_chunks(editor, chunk_sizes):
+    n = 10 ** 6
+    stream_result = result(editor, range_node(editor, 0, n), ui.StreamResultNode)
+    stream_result.params_dict = {"chunk size": 1000}
+
+    assert stream_result.evaluate() == {"count": n, "sum": n * (n - 1) // 2, "min": 0, "max": n - 1}
+    assert max(chunk_sizes) == 1000
+    assert len(chunk_sizes) == n // 1000
+
+
+def test_scalar_parent_is_broadcast(editor):
+    product = operator(editor, "*", range_node(editor, 0, 5), number(editor, 3))
+    stream_result = result(editor, product, ui.StreamResultNode)
+    assert stream_result.evaluate() == {"count": 5, "sum": 30, "min": 0, "max": 12}
+
+
+def test_streams_of_different_lengths_truncate(editor):
+    total = operator(editor, "+", range_node(editor, 0, 10), range_node(editor, 0, 4))
+    stream_result = result(editor, total, ui.StreamResultNode)
+    assert stream_result.evaluate() == {"count": 4, "sum": 12, "min": 0, "max": 6}
+
+
+def test_chunk_size_param(editor, chunk_sizes):
+    stream_result = result(editor, range_node(editor, 0, 10), ui.StreamResultNode)
+    expected = {"count": 10, "sum": 45, "min": 0, "max": 9}
+
+    assert stream_result.evaluate() == expected
+    assert chunk_sizes == [10]
+
+    chunk_sizes.clear()
+    stream_result.params_dict = {"chunk size": 3}
+    assert stream_result.evaluate() == expected
+    assert chunk_sizes == [3, 3, 3, 1]
+
+
+def test_stream_to_plain_result_is_error(editor):
+    plain_result = result(editor, operator(editor, "+", range_node(editor, 0, 10), number(editor, 1)))
+    with pytest.raises(ValueError):
+        plain_result.evaluate()
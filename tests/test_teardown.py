@@ -0,0 +1,51 @@
+import gc
+
+import pytest
+
+from library.diagnostics import get_resource_counts
+from library.node_editor import NodeEditor
+from test_presets import build_chain
+
+
+@pytest.fixture
+def no_gc():
+    # Узлы должны освобождаться по счетчику ссылок, без циклического сборщика
+    gc.collect()
+    gc.disable()
+    yield
+    gc.enable()
+
+
+def build_and_paint(editor: NodeEditor) -> None:
+    result = build_chain(editor, n_ops=5)
+    result.evaluate()
+    for node in editor.nodes:
+        node.paint(0, 128, 0)
+
+
+def test_clear_releases_resources(no_gc):
+    editor = NodeEditor()
+    start = get_resource_counts()
+    for _ in range(5):
+        build_and_paint(editor)
+        editor.clear()
+        assert get_resource_counts() == start
+
+
+def test_delete_nodes_releases_resources(no_gc):
+    editor = NodeEditor()
+    start = get_resource_counts()
+    for _ in range(5):
+        build_and_paint(editor)
+        editor.delete_nodes(list(editor.nodes))
+        assert get_resource_counts() == start
+
+
+def test_editor_delete_releases_resources(no_gc):
+    start = get_resource_counts()
+    for _ in range(5):
+        editor = NodeEditor()
+        build_and_paint(editor)
+        editor.delete()
+        del editor
+        assert get_resource_counts() == start
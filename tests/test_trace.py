@@ -0,0 +1,70 @@
+from pathlib import Path
+
+import dearpygui.dearpygui as dpg
+
+import ui
+from library.node_editor import NodeEditor
+from library.trace import TraceRecorder, TraceReplayer
+from test_presets import build_chain
+
+
+def result_of(editor: NodeEditor):
+    result, = [n for n in editor.nodes if isinstance(n, ui.ResultNode)]
+    return result.evaluate()
+
+
+def test_record_and_replay_during_fragment_load(tmp_path):
+    source = NodeEditor()
+    build_chain(source, n_ops=2)  # 6, 1, +, 2, +, result
+    nodes = list(source.nodes)
+    fragment = NodeEditor.Fragment.from_nodes(
+        nodes=nodes,
+        positions=[dpg.get_item_pos(n.tag) for n in nodes],
+        params=[n.params_dict for n in nodes]
+    )
+
+    editor = NodeEditor()
+    number = ui.NumberNode()
+    editor.add_node(number)
+    number.params_dict = {"number": 100}
+
+    path = tmp_path / "trace.jsonl.gz"
+    recorder = TraceRecorder(editor, path)
+    recorder.start()
+
+    # Загрузка по шагам, как в FragmentLoader: пользователь работает с частично добавленными узлами
+    steps = editor.iter_add_fragment(fragment)
+    next(steps)
+    partial = next(steps)
+    editor.emit("delete", [], [partial[1]])
+    editor.delete_nodes([partial[1]])
+    partial = next(steps)
+    operator = partial[2]
+    editor._on_link(None, (number._outputs[0].tag, operator._inputs[1].tag))
+    for _ in steps:
+        pass
+
+    recorder.stop()
+    assert result_of(editor) == 6 + 100 + 2
+
+    replayed = NodeEditor()
+    latencies = TraceReplayer(replayed, Path(path)).run()
+
+    assert set(latencies) == {"fragment", "delete", "link"}
+    assert len(list(replayed.nodes)) == len(list(editor.nodes))
+    assert result_of(replayed) == 6 + 100 + 2
+
+
+def test_listener_error_does_not_break_editing():
+    editor = NodeEditor()
+
+    def failing_listener(op, *args):
+        raise RuntimeError(op)
+
+    editor.add_listener(failing_listener)
+    result = build_chain(editor, n_ops=1)  # 6, 1, +, result
+    nodes = list(editor.nodes)[:1]
+    editor.emit("delete", [], nodes)
+    editor.delete_nodes(nodes)
+    assert len(list(editor.nodes)) == 3
+    assert list(result.parents)
@@ -1,12 +1,69 @@
 from __future__ import annotations
+import operator
+import time
+from abc import ABC, abstractmethod
+from itertools import islice, repeat
+from pathlib import Path
 from random import randint
+from typing import Any, Callable, Iterator, Optional
 
 import dearpygui.dearpygui as dpg
 
-from database import db
+from database import get_db
+from library.fragment_loader import FragmentLoader
 from library.node_editor import NodeEditor, Node, NodeFreezer
+from library.trace import TraceRecorder
 from library.window import Window
-from library.value_editor import IntInput, StrCombobox
+from library.value_editor import IntInput, PositiveIntInput, StrCombobox
+
+
+class CalculatorNode(Node, ABC):
+    """ Узел, результат которого кэшируется в БД между сессиями """
+
+    @property
+    def value(self) -> Any:
+        db = get_db()
+        # Предки вычисляются внутри этого же сеанса: одно соединение и одна транзакция на вычисление
+        with db.result_cache_session():
+            key = self.subgraph_hash
+            row = db.select_result_cache(key)
+            if row is not None:
+                return row["value"]
+            value = self.calculate()
+            db.insert_result_cache(key, value, self._subgraph_node_types())
+            return value
+
+    def _subgraph_node_types(self) -> list[str]:
+        """ Типы узлов подграфа. Каждый предок посещается один раз, в отличие от обхода Node.ancestors """
+        seen = {self}
+        stack = [self]
+        while stack:
+            for parent in stack.pop().parents:
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        return sorted({type(n).__name__ for n in seen})
+
+    @abstractmethod
+    def calculate(self) -> Any:
+        pass
+
+
+# Потоковый режим: узел отдает значения порциями (chunk) через генератор.
+# Генераторы ленивые, поэтому следующая порция вычисляется только тогда,
+# когда потребитель запросил ее, и в памяти одновременно находится не больше
+# одной порции на каждый узел графа
+
+def stream_of(node: Node, chunk_size: int) -> Iterator[list]:
+    """ Поток порций значений узла. Скалярный узел повторяет свое значение бесконечно """
+    if is_stream(node):
+        return node.stream(chunk_size)
+    return repeat([node.value] * chunk_size)
+
+
+def is_stream(node: Node) -> bool:
+    """ Является ли значение узла конечным потоком """
+    return getattr(node, "is_stream", False)
 
 
 class NumberNode(Node):
@@ -24,7 +81,35 @@ class NumberNode(Node):
         return NumberNode()
 
 
-class OperatorNode(Node):
+class RangeNode(Node):
+    """ Источник потока целых чисел range(start, stop, step) """
+
+    is_stream = True
+
+    def __init__(self) -> None:
+        super(RangeNode, self).__init__(label="Range", inputs=[], outputs_count=1)
+        self.add_param("start", IntInput(width=100))
+        self.add_param("stop", IntInput(width=100, default_value=100))
+        self.add_param("step", IntInput(width=100, default_value=1))
+
+    def stream(self, chunk_size: int) -> Iterator[list]:
+        params = self.params_dict
+        numbers = iter(range(params["start"], params["stop"], params["step"]))
+        while chunk := list(islice(numbers, chunk_size)):
+            yield chunk
+
+    def copy(self) -> RangeNode:
+        return RangeNode()
+
+
+class OperatorNode(CalculatorNode):
+
+    OPERATIONS: dict[str, Callable[[Any, Any], Any]] = {
+        "+": operator.add,
+        "-": operator.sub,
+        "*": operator.mul,
+        "/": operator.truediv
+    }
 
     def __init__(self) -> None:
         super(OperatorNode, self).__init__(label="Operator", inputs=["1", "2"], outputs_count=1)
@@ -32,20 +117,27 @@ class OperatorNode(Node):
         self.add_param("operation", combobox)
 
     @property
-    def value(self) -> float:
-
-        parents = self.parents
-        parent_1, parent_2 = next(parents), next(parents)
-        operation = self.params_dict["operation"]
-        
-        if operation == "+":
-            return parent_1.value + parent_2.value
-        elif operation == "-":
-            return parent_1.value - parent_2.value
-        elif operation == "*":
-            return parent_1.value * parent_2.value
-        elif operation == "/":
-            return parent_1.value / parent_2.value
+    def is_stream(self) -> bool:
+        return any(is_stream(p) for p in self.parents)
+
+    def calculate(self) -> float:
+        parent_1, parent_2 = self.operands()
+        func = self.OPERATIONS[self.params_dict["operation"]]
+        return func(parent_1.value, parent_2.value)
+
+    def stream(self, chunk_size: int) -> Iterator[list]:
+        parent_1, parent_2 = self.operands()
+        func = self.OPERATIONS[self.params_dict["operation"]]
+        chunks_1 = stream_of(parent_1, chunk_size)
+        chunks_2 = stream_of(parent_2, chunk_size)
+        for chunk_1, chunk_2 in zip(chunks_1, chunks_2):
+            yield list(map(func, chunk_1, chunk_2))
+
+    def operands(self) -> tuple[Node, Node]:
+        # Родители берутся по входам, а не по порядку связей, чтобы результат
+        # соответствовал структурному хэшу подграфа
+        input_1, input_2 = self.inputs
+        return self.parent_by_input(input_1), self.parent_by_input(input_2)
 
     def copy(self) -> OperatorNode:
         return OperatorNode()
@@ -53,36 +145,102 @@ class OperatorNode(Node):
 
 class ResultNode(Node):
 
-    def __init__(self) -> None:
-        super(ResultNode, self).__init__(label="Result", inputs=[""], outputs_count=0)
-        with dpg.stage():
+    def __init__(self, label: str = "Result") -> None:
+        super(ResultNode, self).__init__(label=label, inputs=[""], outputs_count=0)
+        with dpg.stage() as stage:
             btn_result = dpg.add_button(
                 label="=", width=100, height=30, callback=self._on_btn_result_click
             )
             self._text_result = dpg.add_text("Empty")
         self.add_widget(btn_result)
         self.add_widget(self._text_result)
+        dpg.delete_item(stage)
         
     def copy(self) -> ResultNode:
         return ResultNode()
 
+    def evaluate(self) -> Any:
+        """ Вычислить значение подключенного узла """
+        parent = next(self.parents, None)
+        if parent is None:
+            raise ValueError("input is not connected")
+        if is_stream(parent):
+            raise ValueError("stream input must be connected to Stream Result")
+        return parent.value
+
+    def show_result(self, result: Any) -> None:
+        dpg.configure_item(self._text_result, default_value=self._format_result(result))
+        self.paint(0, 128, 0)
+
+    def show_error(self) -> None:
+        dpg.configure_item(self._text_result, default_value="Error")
+        self.paint(128, 0, 0)
+
+    def _format_result(self, result: Any) -> str:
+        return str(result)
+
     def _on_btn_result_click(self) -> None:
         if not list(self.parents):
             return
-        parent = next(self.parents)
         try:
-            result = parent.value
-            dpg.configure_item(self._text_result, default_value=str(result))
-            self.paint(0, 128, 0)
+            result = self.evaluate()
+            self.show_result(result)
         except Exception:
-            dpg.configure_item(self._text_result, default_value="Error")
-            self.paint(128, 0, 0)
+            self.show_error()
+
+
+class StreamResultNode(ResultNode):
+    """ Потребитель потока: считает агрегаты, не храня значения в памяти """
+
+    def __init__(self) -> None:
+        super(StreamResultNode, self).__init__(label="Stream Result")
+        chunk_size_input = PositiveIntInput(width=100, default_value=1024)
+        self.add_param("chunk size", chunk_size_input)
+
+    def copy(self) -> StreamResultNode:
+        return StreamResultNode()
+
+    def evaluate(self) -> dict[str, Any]:
+        """ Агрегаты потока подключенного узла """
+
+        parent = next(self.parents, None)
+        if parent is None:
+            raise ValueError("input is not connected")
+
+        if is_stream(parent):
+            chunk_size = self.params_dict["chunk size"] or 1024
+            chunks = stream_of(parent, chunk_size)
+        else:
+            chunks = iter([[parent.value]])
+
+        count, total = 0, 0
+        minimum, maximum = None, None
+        for chunk in chunks:
+            count += len(chunk)
+            total += sum(chunk)
+            chunk_min, chunk_max = min(chunk), max(chunk)
+            minimum = chunk_min if minimum is None else min(minimum, chunk_min)
+            maximum = chunk_max if maximum is None else max(maximum, chunk_max)
+
+        return {"count": count, "sum": total, "min": minimum, "max": maximum}
+
+    def _format_result(self, result: dict[str, Any]) -> str:
+        return "\n".join(f"{key}: {value}" for key, value in result.items())
 
 
 class CalculatorWindow(Window):
 
     def __init__(self) -> None:
 
+        get_db().sync_node_type_versions({
+            node_cls.__name__: node_cls.version
+            for node_cls in (NumberNode, RangeNode, OperatorNode, ResultNode, StreamResultNode)
+        })
+
+        self._loader: Optional[FragmentLoader] = None
+        self._paste_loaders: list[FragmentLoader] = []
+        self._recorder: Optional[TraceRecorder] = None
+
         with dpg.stage() as self._stage:
 
             self._tag = dpg.add_window(
@@ -96,18 +254,43 @@ class CalculatorWindow(Window):
             self._node_editor = NodeEditor()
             self._node_editor.add(parent=self._tag)
 
-            with dpg.handler_registry():
+            with dpg.handler_registry() as self._handler_registry:
                 self._delete_kph = dpg.add_key_press_handler(
                     key=dpg.mvKey_Delete,
                     callback=self._node_editor.delete_selection
                 )
+                for key, callback in [
+                    (dpg.mvKey_C, self._node_editor.copy_selection),
+                    (dpg.mvKey_V, self._on_paste),
+                    (dpg.mvKey_D, self._on_duplicate)
+                ]:
+                    dpg.add_key_press_handler(key=key, callback=self._on_ctrl_key, user_data=callback)
 
             with dpg.menu_bar(parent=self._tag):
 
                 with dpg.menu(label="Edit"):
+                    dpg.add_menu_item(
+                        label="Copy",
+                        shortcut="Ctrl+C",
+                        callback=self._node_editor.copy_selection
+                    )
+                    dpg.add_menu_item(
+                        label="Paste",
+                        shortcut="Ctrl+V",
+                        callback=self._on_paste
+                    )
+                    dpg.add_menu_item(
+                        label="Duplicate",
+                        shortcut="Ctrl+D",
+                        callback=self._on_duplicate
+                    )
                     dpg.add_menu_item(
                         label="Clear",
-                        callback=self._node_editor.clear
+                        callback=self._on_clear
+                    )
+                    dpg.add_menu_item(
+                        label="Evaluate optimized",
+                        callback=self._on_evaluate_optimized
                     )
 
                 with dpg.menu(label="Nodes"):
@@ -115,6 +298,10 @@ class CalculatorWindow(Window):
                         label="Number",
                         callback=self._on_add_number_node
                     )
+                    dpg.add_menu_item(
+                        label="Range",
+                        callback=self._on_add_range_node
+                    )
                     dpg.add_menu_item(
                         label="Operator",
                         callback=self._on_add_operator_node
@@ -123,6 +310,10 @@ class CalculatorWindow(Window):
                         label="Result",
                         callback=self._on_add_result_node
                     )
+                    dpg.add_menu_item(
+                        label="Stream Result",
+                        callback=self._on_add_stream_result_node
+                    )
 
                 with dpg.menu(label="Presets") as self._presets_menu:
                     dpg.add_menu_item(
@@ -130,7 +321,7 @@ class CalculatorWindow(Window):
                         callback=self._on_save_preset
                     )
 
-                    rows = db.select_node_editor_states_info()
+                    rows = get_db().select_node_editor_states_info()
                     if rows:
                         dpg.add_separator()
 
@@ -147,13 +338,83 @@ class CalculatorWindow(Window):
                                 user_data=row["rowid"]
                             )
 
+                with dpg.menu(label="Trace"):
+                    self._record_menu_item = dpg.add_menu_item(
+                        label="Start recording",
+                        callback=self._on_toggle_recording
+                    )
+
+                with dpg.group(horizontal=True, show=False) as self._load_group:
+                    self._load_progress = dpg.add_progress_bar(width=200, overlay="Loading...")
+                    dpg.add_button(label="Cancel", callback=self._cancel_load)
+
+    def delete(self) -> None:
+        self._cancel_load()
+        self._cancel_paste()
+        if self._recorder is not None:
+            self._recorder.stop()
+        dpg.delete_item(self._handler_registry)
+        self._node_editor.delete()
+        super(CalculatorWindow, self).delete()
+
     def _on_close(self) -> None:
-        dpg.delete_item(self._delete_kph)
+        self.delete()
+
+    def _on_toggle_recording(self) -> None:
+        if self._recorder is None:
+            self._recorder = TraceRecorder(self._node_editor, Path(f"trace_{int(time.time())}.jsonl.gz"))
+            self._recorder.start()
+            dpg.configure_item(self._record_menu_item, label="Stop recording")
+        else:
+            self._recorder.stop()
+            self._recorder = None
+            dpg.configure_item(self._record_menu_item, label="Start recording")
+
+    def _on_ctrl_key(self, sender, app_data, callback: Callable) -> None:
+        # Обработчики клавиш глобальные: срабатывают, только если в фокусе это окно
+        # и не редактируется поле ввода параметра узла
+        if not dpg.is_key_down(dpg.mvKey_Control) or not dpg.is_item_focused(self._tag):
+            return
+        for node in self._node_editor.nodes:
+            if any(dpg.is_item_active(param.editor.tag) for param in node.params):
+                return
+        callback()
+
+    def _on_paste(self) -> None:
+        """ Вставка буфера порциями по кадрам, как и загрузка пресета """
+
+        def on_finish(completed: bool) -> None:
+            self._paste_loaders.remove(loader)
+
+        clipboard = self._node_editor.clipboard
+        if clipboard is None:
+            return
+
+        loader = FragmentLoader(
+            editor=self._node_editor,
+            load=lambda: clipboard,
+            offset=self._node_editor.next_paste_offset(),
+            on_finish=on_finish
+        )
+        self._paste_loaders.append(loader)
+        loader.start()
+
+    def _on_duplicate(self) -> None:
+        self._node_editor.copy_selection()
+        self._on_paste()
+
+    def _cancel_paste(self) -> None:
+        for loader in self._paste_loaders:
+            loader.cancel()
 
     def _on_add_number_node(self) -> None:
         node = NumberNode()
         self._node_editor.add_node(node)
 
+    def _on_add_range_node(self) -> None:
+        node = RangeNode()
+        self._node_editor.add_node(node)
+
     def _on_add_operator_node(self) -> None:
         node = OperatorNode()
         self._node_editor.add_node(node)
@@ -162,11 +423,30 @@ class CalculatorWindow(Window):
         node = ResultNode()
         self._node_editor.add_node(node)
 
+    def _on_add_stream_result_node(self) -> None:
+        node = StreamResultNode()
+        self._node_editor.add_node(node)
+
+    def _on_evaluate_optimized(self) -> None:
+
+        from optimizer import evaluate_optimized
+        results, report = evaluate_optimized(self._node_editor)
+
+        for node, result in results.items():
+            if isinstance(result, Exception):
+                node.show_error()
+            else:
+                node.show_result(result)
+
+        with dpg.window(label="Optimization report", autosize=True):
+            dpg.add_text(str(report))
+
     def _on_save_preset(self) -> None:
 
         preset_name = str(randint(0, 1000))
+        self._node_editor.emit("save")
         state = NodeFreezer.get_editor_state(self._node_editor)
-        rowid = db.insert_node_editor_state(preset_name, state)
+        rowid = get_db().insert_node_editor_state(preset_name, state)
 
         with dpg.menu(parent=self._presets_menu, label=preset_name):
             dpg.add_menu_item(
@@ -180,11 +460,44 @@ class CalculatorWindow(Window):
                 user_data=rowid
             )
 
+    def _on_clear(self) -> None:
+        self._cancel_load()
+        self._cancel_paste()
+        self._node_editor.clear()
+
     def _on_load_preset(self, sender, app_data, rowid: int) -> None:
-        row = db.select_node_editor_state(rowid)
-        state = row["state"]
-        NodeFreezer.restore_editor_state(self._node_editor, state)
+
+        def load() -> NodeEditor.Fragment:
+            # Выполняется в отдельном потоке: чтение из БД и декодирование jsonpickle
+            row = get_db().select_node_editor_state(rowid)
+            return NodeFreezer.get_fragment(row["state"])
+
+        def on_finish(completed: bool) -> None:
+            if self._loader is loader:
+                self._loader = None
+                dpg.hide_item(self._load_group)
+
+        self._cancel_load()
+        self._cancel_paste()
+        self._node_editor.clear()
+
+        loader = FragmentLoader(
+            editor=self._node_editor,
+            load=load,
+            on_progress=lambda progress: dpg.set_value(self._load_progress, progress),
+            on_finish=on_finish
+        )
+        self._loader = loader
+        dpg.set_value(self._load_progress, 0)
+        dpg.show_item(self._load_group)
+        loader.start()
+
+    def _cancel_load(self) -> None:
+        if self._loader is not None:
+            self._loader.cancel()
+            self._loader = None
+            dpg.hide_item(self._load_group)
 
     def _on_delete_preset(self, sender, app_data, rowid: int) -> None:
-        db.delete_node_editor_state(rowid)
+        get_db().delete_node_editor_state(rowid)
         dpg.delete_item(dpg.get_item_parent(sender))